@@ -0,0 +1,49 @@
+# app/embeddings.py
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+import httpx
+from langchain_openai import OpenAIEmbeddings
+
+# One HTTP connection pool shared by every OpenAI-bound client (chat and
+# embeddings): keep-alive + HTTP/2 multiplexing means only the very first
+# call pays the TLS handshake.
+HTTP_CLIENT = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=50, keepalive_expiry=30),
+)
+HTTP_ASYNC_CLIENT = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=50, keepalive_expiry=30),
+)
+
+# Embedding backend selection (query side and ingestion must match!):
+# - default: OpenAI text-embedding-3-small (remote, ~100-300 ms per query)
+# - set EMBEDDINGS_BASE_URL to an OpenAI-compatible local server, e.g. an
+#   Infinity instance serving BAAI/bge-small-en-v1.5:
+#       infinity_emb v2 --model-id BAAI/bge-small-en-v1.5 --port 7997
+#       EMBEDDINGS_BASE_URL=http://localhost:7997/v1
+#       EMBEDDINGS_MODEL=bge-small-en-v1.5
+#   Localhost inference removes the network round-trip from every policy
+#   lookup. Re-run ingestion.py after switching so stored vectors match.
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "text-embedding-3-small")
+EMBEDDINGS_BASE_URL = os.getenv("EMBEDDINGS_BASE_URL")
+
+
+def build_embedding_function() -> OpenAIEmbeddings:
+    if EMBEDDINGS_BASE_URL:
+        return OpenAIEmbeddings(
+            model=EMBEDDINGS_MODEL,
+            openai_api_base=EMBEDDINGS_BASE_URL,
+            openai_api_key=os.getenv("EMBEDDINGS_API_KEY", "sk-dummy"),
+            # local servers don't use OpenAI's tokenizer-based length check
+            check_embedding_ctx_length=False,
+            http_client=HTTP_CLIENT,
+            http_async_client=HTTP_ASYNC_CLIENT,
+        )
+    return OpenAIEmbeddings(
+        model=EMBEDDINGS_MODEL,
+        http_client=HTTP_CLIENT,
+        http_async_client=HTTP_ASYNC_CLIENT,
+    )
@@ -1,18 +1,26 @@
 # app/graph.py
 import os
 import re
+import queue
+import threading
+import time
 import operator
+import aiosqlite
 import psycopg2
-from typing import TypedDict, Annotated, List
+import psycopg2.extras
+import psycopg2.pool
+from contextlib import contextmanager
+from typing import TypedDict, Annotated, List, Optional
 from dotenv import load_dotenv
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, ToolMessage
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
-from app.rag import retrieve_info
+from app.embeddings import HTTP_CLIENT, HTTP_ASYNC_CLIENT
+from app.rag import retrieve_info, retrieve_info_batch
 
 load_dotenv()
 
@@ -63,38 +71,133 @@ WORD_TO_DIGIT = {
     "ცხრა": "9",
 }
 
-def get_db_connection():    
-    try:
-        conn = psycopg2.connect(
+# Connection pool (created lazily so importing the module doesn't require
+# a live database). Amortizes TCP/auth setup across tool calls.
+_POOL: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+
+def _get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    global _POOL
+    if _POOL is None:
+        _POOL = psycopg2.pool.ThreadedConnectionPool(
+            minconn=1,
+            maxconn=10,
             dbname=DB_NAME,
             user=DB_USER,
             password=DB_PASS,
-            host=DB_HOST
+            host=DB_HOST,
+            port=DB_PORT,
         )
-        return conn
-    except Exception as e:
-        print(f"❌ Database Connection Error on Port: {e}")
-        return None
+    return _POOL
+
+@contextmanager
+def get_db_connection():
+    """Borrow a pooled connection; the pool reclaims it on exit."""
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+# Pre-compiled patterns (built once at import, not per call).
+# Longest-first alternation so e.g. "ნოლი" wins over "ნოლ"; the lookaround
+# boundaries keep whole-word matching ("one" must not match inside "phone").
+_WORD_RE = re.compile(
+    r"(?<!\w)(?:"
+    + "|".join(re.escape(w) for w in sorted(WORD_TO_DIGIT, key=len, reverse=True))
+    + r")(?!\w)",
+    re.IGNORECASE,
+)
+_NON_DIGIT_RE = re.compile(r"\D")
+_DIGIT_RUN_RE = re.compile(r"\d+")
+# digit -> " word" so a whole run translates in one C-level pass
+_DIGIT_TRANSLATE = {ord(d): " " + ka for d, ka in DIGIT_TO_KA.items()}
 
 def georgianize_digits_for_tts(text: str) -> str:
     # Replace each digit sequence with Georgian digit-words (digit-by-digit)
-    def repl(m):
-        s = m.group(0)
-        return " ".join(DIGIT_TO_KA.get(ch, ch) for ch in s)
-    return re.sub(r"\d+", repl, text)
+    return _DIGIT_RUN_RE.sub(
+        lambda m: m.group(0).translate(_DIGIT_TRANSLATE).lstrip(), text
+    )
 
 def normalize_phone_to_digits(phone: str) -> str:
     """Convert spoken digit-words (Georgian/English) -> digits, then keep digits only."""
-    t = (phone or "").lower()
-    for w, d in WORD_TO_DIGIT.items():
-        t = re.sub(rf"\b{re.escape(w)}\b", d, t)
-    return re.sub(r"\D", "", t)
+    t = _WORD_RE.sub(lambda m: WORD_TO_DIGIT[m.group(0).lower()], (phone or "").lower())
+    return _NON_DIGIT_RE.sub("", t)
 
 
 # In-memory dedupe for demo (resets on restart)
 # Key is (lowercased name, digits-only phone)
 LEADS_SAVED: set[tuple[str, str]] = set()
 
+# Dedup is enforced in Postgres (works across workers and restarts):
+#   CREATE UNIQUE INDEX IF NOT EXISTS leads_name_phone_uniq
+#       ON leads (lower(name), phone);
+# ON CONFLICT DO NOTHING makes every insert idempotent against it; the
+# in-memory LEADS_SAVED set remains only as a fast per-process guard so
+# the agent can answer "already saved" without a DB round-trip.
+
+# Write-behind queue: the writer thread drains whatever has accumulated
+# (up to _FLUSH_MAX_ROWS or _FLUSH_INTERVAL_S) and inserts it in a single
+# round-trip, so the agent's reply never waits on Postgres and batch load
+# (replays, backfills) collapses N inserts into one statement.
+_LEAD_QUEUE: queue.Queue = queue.Queue(maxsize=10_000)
+_FLUSH_MAX_ROWS = 500
+_FLUSH_INTERVAL_S = 0.5
+
+
+def _flush_leads(rows: list[tuple[str, str, tuple[str, str]]]):
+    try:
+        with get_db_connection() as conn:
+            with conn:
+                with conn.cursor() as cur:
+                    if len(rows) == 1:
+                        cur.execute(
+                            """
+                            INSERT INTO leads (name, phone)
+                            VALUES (%s, %s)
+                            ON CONFLICT DO NOTHING
+                            RETURNING id
+                            """,
+                            rows[0][:2],
+                        )
+                        saved = 1 if cur.fetchone() else 0
+                    else:
+                        psycopg2.extras.execute_values(
+                            cur,
+                            "INSERT INTO leads (name, phone) VALUES %s"
+                            " ON CONFLICT DO NOTHING",
+                            [(name, phone) for name, phone, _ in rows],
+                            page_size=1000,
+                        )
+                        saved = cur.rowcount
+        for name, phone, _ in rows:
+            print(f"\n🔥 HOT LEAD SAVED TO DB: {name} ({phone}) 🔥\n")
+        if saved < len(rows):
+            print(f"ℹ️ {len(rows) - saved} duplicate lead(s) skipped by ON CONFLICT")
+    except Exception as e:
+        print(f"❌ Lead insert error: {e}")
+        # Allow a retry on the next save attempt
+        for _, _, key in rows:
+            LEADS_SAVED.discard(key)
+
+
+def _lead_writer():
+    while True:
+        rows = [_LEAD_QUEUE.get()]
+        deadline = time.monotonic() + _FLUSH_INTERVAL_S
+        while len(rows) < _FLUSH_MAX_ROWS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(_LEAD_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _flush_leads(rows)
+
+
+threading.Thread(target=_lead_writer, daemon=True, name="lead-writer").start()
+
 
 @tool
 def save_lead_mock(name: str, phone: str):
@@ -112,31 +215,11 @@ def save_lead_mock(name: str, phone: str):
     if key in LEADS_SAVED:
         return "Lead already saved. Do not save again. End the call."
 
-    conn = get_db_connection()
-    if conn is None:
-        return "Database error. Tell the user we will call them later."
-
-    try:
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO leads (name, phone)
-                    VALUES (%s, %s)
-                    """,
-                    (clean_name, phone_digits),
-                )
-        LEADS_SAVED.add(key)
-        print(f"\n🔥 HOT LEAD SAVED TO DB: {clean_name} ({phone_digits}) 🔥\n")
-        return "Success. Lead saved. Tell the user the manager will contact them."
-    except Exception as e:
-        print(f"❌ Lead insert error: {e}")
-        return "Database error. Tell the user we will call them later."
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+    # Mark as saved up front so dedup works immediately; the write itself
+    # happens in the background and un-marks on failure.
+    LEADS_SAVED.add(key)
+    _LEAD_QUEUE.put((clean_name, phone_digits, key))
+    return "Success. Lead saved. Tell the user the manager will contact them."
 
 
 
@@ -147,13 +230,57 @@ def lookup_policy(query: str):
 
 
 tools = [lookup_policy, save_lead_mock]
-tool_node = ToolNode(tools)
+_TOOLS_BY_NAME = {t.name: t for t in tools}
+
+
+def tool_node(state: "AgentState"):
+    """Execute the pending tool calls, coalescing parallel policy lookups.
+
+    When the model issues several lookup_policy calls in one turn, answer
+    them with a single batched embedding request instead of one OpenAI
+    round-trip per call.
+    """
+    tool_calls = state["messages"][-1].tool_calls
+    policy_calls = [c for c in tool_calls if c["name"] == "lookup_policy"]
+
+    # Failures become error ToolMessages (as prebuilt ToolNode does with
+    # handle_tool_errors=True) so the model can recover instead of the
+    # whole graph run aborting.
+    batched_answers = {}
+    if len(policy_calls) > 1:
+        try:
+            answers = retrieve_info_batch(
+                [c["args"].get("query", "") for c in policy_calls]
+            )
+            batched_answers = {c["id"]: a for c, a in zip(policy_calls, answers)}
+        except Exception as e:
+            batched_answers = {
+                c["id"]: f"Error: {e!r}\n Please fix your mistakes."
+                for c in policy_calls
+            }
+
+    results = []
+    for call in tool_calls:
+        if call["id"] in batched_answers:
+            content = batched_answers[call["id"]]
+        else:
+            try:
+                content = _TOOLS_BY_NAME[call["name"]].invoke(call["args"])
+            except Exception as e:
+                content = f"Error: {e!r}\n Please fix your mistakes."
+        results.append(
+            ToolMessage(content=str(content), name=call["name"], tool_call_id=call["id"])
+        )
+    return {"messages": results}
 
 class AgentState(TypedDict):
     messages: Annotated[List, operator.add]
 
-SYSTEM_PROMPT = f"""
-შენ ხარ {COMPANY_NAME}-ის პროფესიონალი AI გაყიდვების აგენტი {COMPANY_CITY}-ში, საქართველო.
+# Kept byte-identical across tenants/config (no interpolation) so OpenAI's
+# automatic prompt caching can reuse the prefix; the tenant-specific values
+# are injected via the short TENANT_PROMPT message that follows it.
+SYSTEM_PROMPT = """
+შენ ხარ <კომპანია>-ის პროფესიონალი AI გაყიდვების აგენტი <ქალაქი>-ში, საქართველო.
 მისია: ზუსტად უპასუხო კითხვებს და საჭიროების შემთხვევაში შეაგროვო კლიენტის საკონტაქტო ინფორმაცია (სახელი + ტელეფონი).
 
 ძირითადი წესები:
@@ -164,7 +291,7 @@ SYSTEM_PROMPT = f"""
 5) უპასუხე მხოლოდ მომხმარებლის შეკითხვას 1–2 წინადადებით. ნუ დაამატებ სხვა დეტალებს, თუ პირდაპირ არ გთხოვა.
 6) თუ მომხმარებელი უკვე დაინტერესდა/დათანხმდა, შეწყვიტე „გაყიდვა“ და გადადი მონაცემების შეგროვებაზე.
 7) ზარის დასრულებისას ბოლო სტრიქონად ყოველთვის დაწერე ზუსტად ეს ფრაზა (არ შეცვალო არც ერთი სიმბოლო):
-   "დიდი მადლობა ზარისთვის {COMPANY_NAME}-ში. ნახვამდის!"
+   "დიდი მადლობა ზარისთვის <კომპანია>-ში. ნახვამდის!"
 
 ნაკადი:
 A) დახმარებაზე ორიენტირებული საუბარი
@@ -197,13 +324,28 @@ C) ლიდის შენახვა
   უპასუხე მოკლედ და დაასრულე წესის #7 ფრაზით (როგორც ბოლო სტრიქონი).
 """
 
+# Tenant-specific values, kept out of the long cached prefix above
+TENANT_PROMPT = f"""
+<კომპანია> = {COMPANY_NAME}
+<ქალაქი> = {COMPANY_CITY}
+ყველგან, სადაც ინსტრუქციებში <კომპანია> ან <ქალაქი> გხვდება, ჩაანაცვლე ეს მნიშვნელობები.
+"""
 
 
-model = ChatOpenAI(model="gpt-4.1-mini", temperature=0.2)
+model = ChatOpenAI(
+    model="gpt-4.1-mini",
+    temperature=0.2,
+    # share the keep-alive pool with the embedding clients
+    http_client=HTTP_CLIENT,
+    http_async_client=HTTP_ASYNC_CLIENT,
+)
 model_with_tools = model.bind_tools(tools)
 
 def agent(state: AgentState):
-    messages = [SystemMessage(content=SYSTEM_PROMPT)] + state["messages"]
+    messages = [
+        SystemMessage(content=SYSTEM_PROMPT),
+        SystemMessage(content=TENANT_PROMPT),
+    ] + state["messages"]
     response = model_with_tools.invoke(messages)
     return {"messages": [response]}
 
@@ -220,4 +362,10 @@ workflow.set_entry_point("agent")
 workflow.add_conditional_edges("agent", should_continue)
 workflow.add_edge("tools", "agent")
 
-app = workflow.compile()
+# Persist conversation state per thread_id so each request only has to
+# carry the new user turn instead of replaying the whole transcript.
+# Async saver: the graph now runs on the event loop via astream, and the
+# connection is started lazily on first use.
+checkpointer = AsyncSqliteSaver(aiosqlite.connect("leadflow_state.db"))
+
+app = workflow.compile(checkpointer=checkpointer)
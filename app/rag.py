@@ -1,10 +1,11 @@
 import os
+from functools import lru_cache
 # --- ADD THESE TWO LINES AT THE VERY TOP ---
 from dotenv import load_dotenv
 load_dotenv()  # This loads OPENAI_API_KEY immediately
 
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+from app.embeddings import build_embedding_function
 
 # Define the path to the database folder
 DB_PATH = "chroma_db"
@@ -12,14 +13,36 @@ DB_PATH = "chroma_db"
 print("⏳ Loading Database into Memory... (Runs once)")
 
 # Now this will work because the key is loaded
-embedding_function = OpenAIEmbeddings(model="text-embedding-3-small")
+embedding_function = build_embedding_function()
 db = Chroma(persist_directory=DB_PATH, embedding_function=embedding_function)
 
 print("✅ Database Loaded!")
 
-def retrieve_info(query: str):
-    results = db.similarity_search(query, k=3)
+# Raw Chroma collection handle, held once so the batch path can query
+# with pre-computed embeddings instead of going through the wrapper.
+_collection = db._collection
+
+@lru_cache(maxsize=512)
+def _cached_retrieve(q_norm: str) -> str:
+    results = db.similarity_search(q_norm, k=3)
     if results:
         return "\n\n".join([doc.page_content for doc in results])
     else:
-        return "No relevant company policy found."
\ No newline at end of file
+        return "No relevant company policy found."
+
+def retrieve_info(query: str):
+    # Callers ask the same questions constantly ("what are your hours?");
+    # caching skips the embedding round-trip + vector search on repeats.
+    q_norm = " ".join((query or "").lower().split())
+    return _cached_retrieve(q_norm)
+
+def retrieve_info_batch(queries: list[str]) -> list[str]:
+    """Answer several queries with one embedding request and one Chroma query."""
+    vecs = embedding_function.embed_documents(
+        [" ".join((q or "").lower().split()) for q in queries]
+    )
+    res = _collection.query(query_embeddings=vecs, n_results=3)
+    return [
+        "\n\n".join(docs) if docs else "No relevant company policy found."
+        for docs in res["documents"]
+    ]
\ No newline at end of file
@@ -1,8 +1,9 @@
 import os
 import time
-import json
+import uuid
 import logging
 import asyncio
+import orjson
 import re
 import string
 from typing import Optional, List
@@ -14,6 +15,7 @@ import uvicorn
 
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from app.graph import app, georgianize_digits_for_tts  # your compiled LangGraph
+from app.rag import retrieve_info
 from dotenv import load_dotenv
 
 # -----------------------------
@@ -57,6 +59,17 @@ app_server.add_middleware(
     allow_headers=["*"],
 )
 
+@app_server.on_event("startup")
+async def warmup():
+    # Open the TLS connection to the embedding backend (and prime the
+    # policy cache for a common question) so the first caller doesn't pay
+    # the cold-connection cost.
+    try:
+        await asyncio.to_thread(retrieve_info, "სამუშაო საათები")
+    except Exception:
+        logger.warning("Warmup lookup failed (continuing)", exc_info=True)
+
+
 @app_server.get("/health")
 def health():
     return {"ok": True}
@@ -69,28 +82,33 @@ def vapi_config():
 # -----------------------------
 # Helpers
 # -----------------------------
+# system/other roles are ignored to avoid duplicating the system prompt
+_ROLE_MAP = {"user": HumanMessage, "assistant": AIMessage}
+
+
 def to_lc_message(m: dict) -> Optional[BaseMessage]:
-    role = m.get("role")
     content = (m.get("content") or "").strip()
     if not content:
         return None
+    cls = _ROLE_MAP.get(m.get("role"))
+    return cls(content=content) if cls else None
 
-    if role == "user":
-        return HumanMessage(content=content)
-    if role == "assistant":
-        return AIMessage(content=content)
 
-    # ignore system/other roles to avoid duplicating system prompt
-    return None
+def get_thread_id(data: dict) -> str:
+    # str(None) is "None" (truthy), so the old `or` chain never fell
+    # through past conversation_id — every un-IDed call shared one thread.
+    for key in ("conversation_id", "call_id", "session_id"):
+        value = data.get(key)
+        if value:
+            return str(value)
+    # Unique fallback so anonymous concurrent calls never share state
+    return uuid.uuid4().hex
 
 
-def get_thread_id(data: dict) -> str:
-    return (
-        str(data.get("conversation_id"))
-        or str(data.get("call_id"))
-        or str(data.get("session_id"))
-        or str(int(time.time() * 1000))
-    )
+# Built once at import — rebuilding the translate table and recompiling
+# the regex per request is pure overhead on the hot path.
+_PUNCT_TABLE = str.maketrans("", "", string.punctuation)
+_WS_RE = re.compile(r"\s+")
 
 
 def _normalize_for_match(s: str) -> str:
@@ -102,68 +120,77 @@ def _normalize_for_match(s: str) -> str:
     """
     if not s:
         return ""
-    s = s.lower()
-    s = s.translate(str.maketrans("", "", string.punctuation))
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    return _WS_RE.sub(" ", s.lower().translate(_PUNCT_TABLE)).strip()
 
 
-def should_end_call(final_response: str) -> bool:
-    fr = _normalize_for_match(final_response)
+# One pattern covers every punctuation/spacing variant of the end phrase
+# against the normalized text ("-ში"/"." normalize away), replacing the
+# old literal-variant list with a single scan.
+_END_RE = re.compile(
+    rf"დიდი\s+მადლობა\s+ზარისთვის\s+{re.escape(_normalize_for_match(COMPANY_NAME))}(?:ში)?\s+ნახვამდის"
+)
 
-    # Accept a few common variants (punctuation/spaces differ)
-    variants = [
-        END_PHRASE,
-        f"დიდი მადლობა ზარისთვის {COMPANY_NAME}-ში. ნახვამდის!",
-        f"დიდი მადლობა ზარისთვის {COMPANY_NAME}-ში ნახვამდის!",
-        f"დიდი მადლობა ზარისთვის {COMPANY_NAME} ნახვამდის!",
-    ]
-    return any(_normalize_for_match(v) in fr for v in variants)
+
+def should_end_call(final_response: str) -> bool:
+    return bool(_END_RE.search(_normalize_for_match(final_response)))
 
 # -----------------------------
 # Streaming generator
 # -----------------------------
+# The ack, endCall and stop frames only vary by id/created/tool_call_id,
+# so they are pre-rendered as byte templates — no dict build or JSON
+# encode per frame. Only content-bearing chunks go through orjson.
+_ACK_TMPL = (
+    b'data: {"id":"%b","object":"chat.completion.chunk","created":%d,'
+    b'"model":"leadflow-v1","choices":[{"index":0,'
+    b'"delta":{"role":"assistant"},"finish_reason":null}]}\n\n'
+)
+_END_CALL_TMPL = (
+    b'data: {"id":"%b","object":"chat.completion.chunk","created":%d,'
+    b'"model":"leadflow-v1","choices":[{"index":0,'
+    b'"delta":{"tool_calls":[{"index":0,"id":"%b","type":"function",'
+    b'"function":{"name":"endCall","arguments":"{}"}}]},'
+    b'"finish_reason":"tool_calls"}]}\n\n'
+)
+_STOP_TMPL = (
+    b'data: {"id":"%b","object":"chat.completion.chunk","created":%d,'
+    b'"model":"leadflow-v1","choices":[{"index":0,'
+    b'"delta":{},"finish_reason":"stop"}]}\n\n'
+)
+_DONE_FRAME = b"data: [DONE]\n\n"
+
+
 async def stream_generator(history: List[BaseMessage], thread_id: str):
-    chunk_id = f"chatcmpl-{int(time.time())}"
-    created = int(time.time())
+    # One clock read per stream: chunk_id/created/tool_call_id must agree
+    # across every frame of the same response.
+    now = time.time()
+    created = int(now)
+    chunk_id = f"chatcmpl-{created}"
+    tool_call_id = f"call_{int(now * 1000)}"
 
     # --- STEP 1: INSTANT ACK ---
-    yield (
-        "data: "
-        + json.dumps(
-            {
-                "id": chunk_id,
-                "object": "chat.completion.chunk",
-                "created": created,
-                "model": "leadflow-v1",
-                "choices": [{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}],
-            }
-        )
-        + "\n\n"
-    )
+    yield _ACK_TMPL % (chunk_id.encode(), created)
 
     try:
         # --- STEP 2: RUN THE BRAIN with FULL HISTORY ---
         config = {"configurable": {"thread_id": thread_id}}
 
-        events = await asyncio.to_thread(
-            lambda: list(
-                app.stream(
-                    {"messages": history},
-                    config=config,
-                    stream_mode="values",
-                )
-            )
-        )
+        last_event = None
+        async for event in app.astream(
+            {"messages": history},
+            config=config,
+            stream_mode="values",
+        ):
+            last_event = event
 
-        final_response = events[-1]["messages"][-1].content or ""
+        final_response = (last_event["messages"][-1].content or "") if last_event else ""
         spoken_response = georgianize_digits_for_tts(final_response)
         logger.info(f"🗣️ Brain Said: {final_response}")
 
         # --- STEP 3: SEND CONTENT ---
         yield (
-            "data: "
-            + json.dumps(
+            b"data: "
+            + orjson.dumps(
                 {
                     "id": chunk_id,
                     "object": "chat.completion.chunk",
@@ -174,49 +201,21 @@ async def stream_generator(history: List[BaseMessage], thread_id: str):
                     ],
                 }
             )
-            + "\n\n"
+            + b"\n\n"
         )
 
         # Decide whether we should end the call
         if should_end_call(final_response):
             await asyncio.sleep(0.8)  # allow TTS to start speaking
 
-            tool_call_id = f"call_{int(time.time() * 1000)}"
-            yield (
-                "data: "
-                + json.dumps(
-                    {
-                        "id": chunk_id,
-                        "object": "chat.completion.chunk",
-                        "created": created,
-                        "model": "leadflow-v1",
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {
-                                    "tool_calls": [
-                                        {
-                                            "index": 0,
-                                            "id": tool_call_id,
-                                            "type": "function",
-                                            "function": {"name": "endCall", "arguments": "{}"},
-                                        }
-                                    ]
-                                },
-                                "finish_reason": "tool_calls",
-                            }
-                        ],
-                    }
-                )
-                + "\n\n"
-            )
+            yield _END_CALL_TMPL % (chunk_id.encode(), created, tool_call_id.encode())
 
     except Exception as e:
         logger.exception("Streaming error")
         # Send a safe fallback message so the client isn't left hanging
         yield (
-            "data: "
-            + json.dumps(
+            b"data: "
+            + orjson.dumps(
                 {
                     "id": chunk_id,
                     "object": "chat.completion.chunk",
@@ -231,24 +230,12 @@ async def stream_generator(history: List[BaseMessage], thread_id: str):
                     ],
                 }
             )
-            + "\n\n"
+            + b"\n\n"
         )
 
     # --- CLOSE STREAM ---
-    yield (
-        "data: "
-        + json.dumps(
-            {
-                "id": chunk_id,
-                "object": "chat.completion.chunk",
-                "created": created,
-                "model": "leadflow-v1",
-                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
-            }
-        )
-        + "\n\n"
-    )
-    yield "data: [DONE]\n\n"
+    yield _STOP_TMPL % (chunk_id.encode(), created)
+    yield _DONE_FRAME
 
 
 # -----------------------------
@@ -259,8 +246,7 @@ async def chat_endpoint(request: Request):
     data = await request.json()
     raw_messages = data.get("messages", [])
 
-    history = [to_lc_message(m) for m in raw_messages]
-    history = [m for m in history if m is not None]
+    history = [lc for m in raw_messages if (lc := to_lc_message(m)) is not None]
 
     if not history:
         history = [HumanMessage(content="Hello")]
@@ -270,6 +256,16 @@ async def chat_endpoint(request: Request):
 
     thread_id = get_thread_id(data)
 
+    # Prior turns live in the graph's checkpointer keyed by thread_id, so
+    # normally only the newest user turn needs to go through the model.
+    # Fall back to the full client history when the thread has no saved
+    # state yet (first turn, or the server restarted mid-call).
+    config = {"configurable": {"thread_id": thread_id}}
+    if (await app.aget_state(config)).values.get("messages"):
+        last_human = next((m for m in reversed(history) if isinstance(m, HumanMessage)), None)
+        if last_human is not None:
+            history = [last_human]
+
     return StreamingResponse(stream_generator(history, thread_id), media_type="text/event-stream")
 
 
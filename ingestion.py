@@ -2,9 +2,10 @@ import os
 from dotenv import load_dotenv
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 
+from app.embeddings import build_embedding_function
+
 load_dotenv()
 
 DATA_PATH = "data/company_policy.pdf"
@@ -26,13 +27,32 @@ def ingest_docs():
 
     # 3. Embed & Store
     print("💾 Saving to vector store...")
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-    
+    embeddings = build_embedding_function()
+
+    # Batch-embed: one API request per 256 chunks instead of one per chunk
+    texts = [d.page_content for d in splits]
+    metadatas = [d.metadata for d in splits]
+    vectors = []
+    batch_size = 256
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+
     # This creates the folder 'chroma_db' in your project root
-    Chroma.from_documents(
-        documents=splits,
-        embedding=embeddings,
-        persist_directory=DB_PATH
+    # HNSW params: sub-linear ANN search instead of a full scan as the KB grows
+    store = Chroma(
+        persist_directory=DB_PATH,
+        embedding_function=embeddings,
+        collection_metadata={
+            "hnsw:space": "cosine",
+            "hnsw:construction_ef": 100,
+            "hnsw:M": 16,
+        },
+    )
+    store._collection.add(
+        ids=[str(i) for i in range(len(texts))],
+        embeddings=vectors,
+        documents=texts,
+        metadatas=metadatas,
     )
     
     print("✅ Success! Knowledge base saved locally.")
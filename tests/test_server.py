@@ -0,0 +1,27 @@
+import os
+
+# server.py fails fast on missing env; supply demo-safe values before import
+os.environ.setdefault("VAPI_PUBLIC_KEY", "test-public-key")
+os.environ.setdefault("VAPI_ASSISTANT_ID", "test-assistant-id")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from app.server import get_thread_id
+
+
+def test_prefers_conversation_id():
+    data = {"conversation_id": "conv-1", "call_id": "call-1", "session_id": "sess-1"}
+    assert get_thread_id(data) == "conv-1"
+
+
+def test_falls_back_through_keys():
+    assert get_thread_id({"call_id": "call-1"}) == "call-1"
+    assert get_thread_id({"session_id": "sess-1"}) == "sess-1"
+
+
+def test_missing_ids_are_skipped_not_stringified():
+    # str(None) is truthy — the old bug pinned every un-IDed call to "None"
+    assert get_thread_id({"conversation_id": None, "call_id": "call-1"}) == "call-1"
+
+
+def test_anonymous_requests_get_distinct_threads():
+    assert get_thread_id({}) != get_thread_id({})